@@ -1,11 +1,19 @@
-from typing import List
-import numpy as np
+from typing import List, Optional
 import torch
 import torch.nn.functional as F
 from torch.autograd import Variable
 import torch.nn as nn
 from deepsat.utils.config_files_utils import get_params_values
-from copy import deepcopy
+
+
+_REDUCE = {None: lambda x: x, 'mean': torch.mean, 'sum': torch.sum}
+
+
+def _get_reduce(reduction, name):
+    if reduction not in _REDUCE:
+        raise ValueError(
+            "%s: reduction parameter not in list of acceptable values [\"mean\", \"sum\", None]" % name)
+    return _REDUCE[reduction]
 
 
 def get_loss(config, device, reduction='mean'):
@@ -16,10 +24,9 @@ def get_loss(config, device, reduction='mean'):
 
     if type(loss_config['loss_function']) in [list, tuple]:
         loss_fun = []
-        loss_types = deepcopy(loss_config['loss_function'])
-        config_ = deepcopy(config)
-        for loss_fun_type in loss_types:
-            config_['SOLVER']['loss_function'] = loss_fun_type
+        for loss_fun_type in loss_config['loss_function']:
+            # shallow copies, only SOLVER.loss_function differs between the sub-configs
+            config_ = {**config, 'SOLVER': {**loss_config, 'loss_function': loss_fun_type}}
             loss_fun.append(get_loss(config_, device, reduction=reduction))
         return loss_fun
 
@@ -44,27 +51,16 @@ def get_loss(config, device, reduction='mean'):
     # Cross-Entropy Loss ------------------------------------------------------------------
     elif loss_config['loss_function'] == 'cross_entropy':
         num_classes = get_params_values(model_config, 'num_classes', None)
-        weight = torch.Tensor(num_classes * [1.0]).to(device)
+        weight = torch.ones(num_classes, device=device)
         if loss_config['class_weights'] not in [None, {}]:
-            for key in loss_config['class_weights']:
-                weight[key] = loss_config['class_weights'][key]
+            for key, value in loss_config['class_weights'].items():
+                weight[key] = value
         return torch.nn.CrossEntropyLoss(weight=weight, reduction=reduction)
 
     # Weighted Cross-Entropy Loss -----------------------------------------------------------
     elif loss_config['loss_function'] == 'weight_cross_entropy':
         label_smoothing = get_params_values(loss_config, "label_smoothing", 0.0)
-        pos_weight = loss_config['pos_weight']
-        if pos_weight is not None:
-            weight_1 = 1. / pos_weight
-            weight_2 = 1.
-            total_weight = weight_1 + weight_2
-            weight_1 = weight_1 / total_weight
-            weight_2 = weight_2 / total_weight
-            weight = torch.tensor([weight_1, weight_2], dtype=torch.float32).to(device)
-            return torch.nn.CrossEntropyLoss(weight=weight, reduction=reduction, label_smoothing=label_smoothing)
-
-        else:
-            return torch.nn.CrossEntropyLoss(reduction=reduction, label_smoothing=label_smoothing)
+        return _binary_weighted_cross_entropy(loss_config['pos_weight'], device, reduction, label_smoothing)
 
     # Masked Cross-Entropy Loss -----------------------------------------------------------
     elif loss_config['loss_function'] == 'masked_cross_entropy':
@@ -79,9 +75,9 @@ def get_loss(config, device, reduction='mean'):
         except ValueError:
             alpha = None
         if loss_config['loss_function'] == 'focal_loss':
-            return FocalLoss(gamma=gamma, alpha=alpha, reduction=reduction)
+            return FocalLoss(gamma=gamma, alpha=alpha, reduction=reduction).to(device)
         elif loss_config['loss_function'] == 'masked_focal_loss':
-            return MaskedFocalLoss(gamma=gamma, alpha=alpha, reduction=reduction)
+            return MaskedFocalLoss(gamma=gamma, alpha=alpha, reduction=reduction).to(device)
 
     # Masked Multiclass Loss -----------------------------------------------------------
     elif loss_config['loss_function'] == 'masked_dice_loss':
@@ -100,37 +96,70 @@ def get_loss(config, device, reduction='mean'):
     elif loss_config['loss_function'] == 'combined_dice_ce':
         loss_fns = [MaskedDiceLoss(reduction=reduction, device=device)]
         label_smoothing = get_params_values(loss_config, "label_smoothing", 0.0)
-        pos_weight = loss_config['pos_weight']
-        if pos_weight is not None:
-            weight_1 = 1. / pos_weight
-            weight_2 = 1.
-            total_weight = weight_1 + weight_2
-            weight_1 = weight_1 / total_weight
-            weight_2 = weight_2 / total_weight
-            weight = torch.tensor([weight_1, weight_2], dtype=torch.float32).to(device)
-            loss_fns.append(torch.nn.CrossEntropyLoss(weight=weight, reduction=reduction, label_smoothing=label_smoothing))
-
-        else:
-            loss_fns.append(torch.nn.CrossEntropyLoss(reduction=reduction, label_smoothing=label_smoothing))
+        loss_fns.append(_binary_weighted_cross_entropy(loss_config['pos_weight'], device, reduction, label_smoothing))
 
         weights = get_params_values(loss_config, "loss_weights", [0.5, 0.5])
-        return CombinedLoss(loss_fns, weights)
+        return CombinedLoss(loss_fns, weights).to(device)
+
+
+def _binary_weighted_cross_entropy(pos_weight, device, reduction, label_smoothing):
+    """
+    binary CrossEntropyLoss with normalized class weights [1/pos_weight, 1], no class weights if pos_weight is None.
+    The weight tensor is allocated once on device and owned by the returned module
+    """
+    weight = None
+    if pos_weight is not None:
+        weight_1 = 1. / pos_weight
+        weight_2 = 1.
+        total_weight = weight_1 + weight_2
+        weight = torch.tensor([weight_1 / total_weight, weight_2 / total_weight], dtype=torch.float32, device=device)
+    return torch.nn.CrossEntropyLoss(weight=weight, reduction=reduction, label_smoothing=label_smoothing)
+
+
+def _parse_gt(ground_truth, name):
+    """
+    splits the ground_truth loss input into (target, mask), mask=None if not provided
+    """
+    if isinstance(ground_truth, torch.Tensor):
+        return ground_truth, None
+    if len(ground_truth) == 1:
+        return ground_truth[0], None
+    if len(ground_truth) == 2:
+        return ground_truth[0], ground_truth[1]
+    raise ValueError("ground_truth parameter for %s is either (target, mask) or (target)" % name)
 
 
 def per_class_loss(criterion, logits, labels, unk_masks, n_classes):
-    class_loss = []
-    class_counts = []
-    for class_ in range(n_classes):
-        idx = labels == class_
-        class_loss.append(
-            criterion(logits[idx.repeat(1, 1, 1, n_classes)].reshape(-1, n_classes),  # ???
-                      labels[idx].reshape(-1, 1),
-                      unk_masks[idx].reshape(-1, 1)).detach().cpu().numpy()
-        )
-        class_counts.append(unk_masks[idx].sum().cpu().numpy())
-    class_loss = np.array(class_loss)
-    class_counts = np.array(class_counts)
-    return np.nan_to_num(class_loss, nan=0.0), class_counts
+    """
+    logits: (N,...,NumClasses), class scores in the last dim
+    criterion must return the unreduced per element loss, e.g. MaskedCrossEntropyLoss(mean=False)
+    """
+    logits_flat = logits.reshape(-1, n_classes)
+    labels_flat = labels.reshape(-1).to(torch.int64)
+    # ignore/unknown labels outside [0, n_classes) do not belong to any class bin
+    mask_flat = (labels_flat >= 0) & (labels_flat < n_classes)
+    if unk_masks is not None:
+        mask_flat = mask_flat & unk_masks.reshape(-1).bool()
+    logits_flat = logits_flat[mask_flat]
+    labels_flat = labels_flat[mask_flat]
+    loss_flat = criterion(logits_flat, labels_flat).detach().reshape(-1)
+    class_loss = torch.zeros(n_classes, device=loss_flat.device).scatter_add_(0, labels_flat, loss_flat.to(torch.float32))
+    class_counts = torch.zeros(n_classes, device=loss_flat.device).scatter_add_(
+        0, labels_flat, torch.ones_like(loss_flat, dtype=torch.float32))
+    class_loss = class_loss / class_counts.clamp(min=1)
+    return class_loss.cpu().numpy(), class_counts.cpu().numpy()
+
+
+@torch.jit.script
+def _masked_contrastive_core(logits: torch.Tensor, target: torch.Tensor, mask: Optional[torch.Tensor],
+                             pos_weight: float) -> torch.Tensor:
+    """
+    linear contrastive loss on similarity scores (not a logistic BCE), scripted so the pointwise ops can be fused
+    """
+    loss = - pos_weight * target * logits + (1 - target) * logits
+    if mask is not None:
+        loss = mask.to(torch.float32) * loss
+    return loss
 
 
 class MaskedContrastiveLoss(torch.nn.Module):
@@ -145,19 +174,9 @@ class MaskedContrastiveLoss(torch.nn.Module):
         self.h = 1e-7
 
     def forward(self, logits, ground_truth):
-        if type(ground_truth) == torch.Tensor:
-            target = ground_truth
-            mask = None
-        elif len(ground_truth) == 1:
-            target = ground_truth[0]
-            mask = None
-        else:
-            target = ground_truth[0]
-            mask = ground_truth[1].to(torch.float32)
-
-        loss = - self.pos_weight * target * logits + (1 - target) * logits
-        if mask is not None:
-            loss = mask * loss
+        target, mask = _parse_gt(ground_truth, "MaskedContrastiveLoss")
+
+        loss = _masked_contrastive_core(logits, target, mask, float(self.pos_weight))
 
         if self.reduction == "mean":
             return loss.mean()  # loss.sum() / (mask.sum() - 1)
@@ -174,13 +193,10 @@ class MaskedBinaryCrossEntropy(torch.nn.Module):
         self.loss_fn = torch.nn.BCEWithLogitsLoss(reduction=reduction, pos_weight=pos_weight)
 
     def forward(self, logits, ground_truth):
-        if type(ground_truth) == torch.Tensor:
-            target = ground_truth
-        elif len(ground_truth) == 1:
-            target = ground_truth[0]
-        else:
-            target = ground_truth[0][ground_truth[1]]
-            logits = logits[ground_truth[1]]
+        target, mask = _parse_gt(ground_truth, "MaskedBinaryCrossEntropy")
+        if mask is not None:
+            target = target[mask]
+            logits = logits[mask]
         return self.loss_fn(logits, target)
 
 
@@ -206,153 +222,104 @@ class MaskedCrossEntropyLoss(torch.nn.Module):
             Returns:
                 loss: An average loss value masked by the length.
             """
-        if type(ground_truth) == torch.Tensor:
-            target = ground_truth
-            mask = None
-        elif len(ground_truth) == 1:
-            target = ground_truth[0]
-            mask = None
-        elif len(ground_truth) == 2:
-            target, mask = ground_truth
-        else:
-            raise ValueError("ground_truth parameter for MaskedCrossEntropyLoss is either (target, mask) or (target)")
+        target, mask = _parse_gt(ground_truth, "MaskedCrossEntropyLoss")
 
+        masked_logits_flat = logits.reshape(-1, logits.size(-1))  # (N*H*W x Nclasses)
+        masked_target_flat = target.reshape(-1).to(torch.int64)  # (N*H*W)
         if mask is not None:
-            mask_flat = mask.reshape(-1, 1)  # (N*H*W x 1)
-            nclasses = logits.shape[-1]
-            logits_flat = logits.reshape(-1, logits.size(-1))  # (N*H*W x Nclasses)
-            masked_logits_flat = logits_flat[mask_flat.repeat(1, nclasses)].view(-1, nclasses)
-            target_flat = target.reshape(-1, 1)  # (N*H*W x 1)
-            masked_target_flat = target_flat[mask_flat].unsqueeze(dim=-1).to(torch.int64)
-        else:
-            masked_logits_flat = logits.reshape(-1, logits.size(-1))  # (N*H*W x Nclasses)
-            masked_target_flat = target.reshape(-1, 1).to(torch.int64)  # (N*H*W x 1)
-        masked_log_probs_flat = torch.nn.functional.log_softmax(masked_logits_flat)  # (N*H*W x Nclasses)
-        masked_losses_flat = -torch.gather(masked_log_probs_flat, dim=1, index=masked_target_flat)  # (N*H*W x 1)
-        if self.mean:
-            return masked_losses_flat.mean()
-        return masked_losses_flat
+            mask_flat = mask.reshape(-1).bool()  # (N*H*W)
+            masked_logits_flat = masked_logits_flat[mask_flat]
+            masked_target_flat = masked_target_flat[mask_flat]
+        return F.cross_entropy(masked_logits_flat, masked_target_flat, reduction='mean' if self.mean else 'none')
+
+
+@torch.jit.script
+def _focal_core(logpt: torch.Tensor, pt: torch.Tensor, gamma: float) -> torch.Tensor:
+    return -1 * (1 - pt).pow(gamma) * logpt
 
 
 class MaskedFocalLoss(nn.Module):
     """
     Credits to  github.com/clcarwin/focal_loss_pytorch
+    logits: (N,...,NumClasses), class scores in the last dim
     """
 
     def __init__(self, gamma=0, alpha=None, reduction=None):
         super(MaskedFocalLoss, self).__init__()
         self.gamma = gamma
-        self.alpha = alpha
-        if isinstance(alpha, (float, int)): self.alpha = torch.Tensor([alpha, 1 - alpha])
-        if isinstance(alpha, list): self.alpha = torch.Tensor(alpha)
+        if isinstance(alpha, (float, int)): alpha = [alpha, 1 - alpha]
+        if alpha is not None: alpha = torch.as_tensor(alpha, dtype=torch.float32)
+        # buffer so that .to(device) moves alpha once instead of casting it on every forward
+        self.register_buffer('alpha', alpha)
         self.reduction = reduction
+        self._reduce = _get_reduce(reduction, "MaskedFocalLoss")
 
     def forward(self, logits, ground_truth):
 
-        if type(ground_truth) == torch.Tensor:
-            target = ground_truth
-            mask = None
-        elif len(ground_truth) == 1:
-            target = ground_truth[0]
-            mask = None
-        elif len(ground_truth) == 2:
-            target, mask = ground_truth
-        else:
-            raise ValueError("ground_truth parameter for MaskedCrossEntropyLoss is either (target, mask) or (target)")
-
-        target = target.reshape(-1, 1).to(torch.int64)
+        target, mask = _parse_gt(ground_truth, "MaskedFocalLoss")
+
+        target = target.reshape(-1).to(torch.int64)
         logits = logits.reshape(-1, logits.shape[-1])
 
         if mask is not None:
-            mask = mask.reshape(-1, 1)
+            mask = mask.reshape(-1).bool()
             target = target[mask]
-            logits = logits[mask.repeat(1, logits.shape[-1])].reshape(-1, logits.shape[-1])
+            logits = logits[mask]
 
-        logpt = F.log_softmax(logits, dim=-1)
-        logpt = logpt.gather(-1, target.unsqueeze(-1))
-        logpt = logpt.reshape(-1)
+        # log p_t = -CE, fused log_softmax + gather that only writes N outputs
+        logpt = -F.cross_entropy(logits, target, reduction='none')
         pt = logpt.exp()  # Variable(logpt.data.exp())
 
         if self.alpha is not None:
-            if self.alpha.type() != logits.data.type():
-                self.alpha = self.alpha.type_as(logits.data)
             at = self.alpha.gather(0, target.data.view(-1))
             logpt = logpt * Variable(at)
 
-        loss = -1 * (1 - pt) ** self.gamma * logpt
+        loss = _focal_core(logpt, pt, float(self.gamma))
 
-        if self.reduction is None:
-            return loss
-        elif self.reduction == "mean":
-            return loss.mean()
-        elif self.reduction == "sum":
-            return loss.sum()
-        else:
-            raise ValueError(
-                "FocalLoss: reduction parameter not in list of acceptable values [\"mean\", \"sum\", None]")
+        return self._reduce(loss)
 
 # Adapted for Binary Classification
 class MaskedDiceLoss(nn.Module):
     """
     Credits to  github.com/clcarwin/focal_loss_pytorch
+    logits: (N,...,NumClasses), class scores in the last dim
     """
 
     def __init__(self, reduction=None, label_smoothing=0., device='cuda'):
         super(MaskedDiceLoss, self).__init__()
         self.reduction = reduction
+        self._reduce = _get_reduce(reduction, "MaskedDiceLoss")
         self.device = device
         self.label_smoothing = label_smoothing
 
     def forward(self, logits, ground_truth):
 
-        if type(ground_truth) == torch.Tensor:
-            target = ground_truth
-            mask = None
-        elif len(ground_truth) == 1:
-            target = ground_truth[0]
-            mask = None
-        elif len(ground_truth) == 2:
-            target, mask = ground_truth
-        else:
-            raise ValueError("ground_truth parameter for MaskedCrossEntropyLoss is either (target, mask) or (target)")
+        target, mask = _parse_gt(ground_truth, "MaskedDiceLoss")
 
         target = target.reshape(-1).to(torch.int64)
         logits = logits.reshape(-1, logits.shape[-1])
+        if logits.shape[-1] != 2:
+            raise ValueError("MaskedDiceLoss: expects 2 classes in the last logits dim, got %d" % logits.shape[-1])
 
         if mask is not None:
-            mask = mask.reshape(-1, 1)
+            mask = mask.reshape(-1).bool()
             target = target[mask]
-            logits = logits[mask.repeat(1, logits.shape[-1])].reshape(-1, logits.shape[-1])
-
-        # Apply label smoothing if specified
-        if self.label_smoothing > 0.0:
-            num_classes = logits.shape[-1]
-            smoothing_value = self.label_smoothing / (num_classes - 1)
-            target_onehot = torch.full((target.size(0), num_classes), smoothing_value, device=self.device)
-            target_onehot.scatter_(1, target.unsqueeze(1), 1.0 - self.label_smoothing)
-        else:
-            # Standard one-hot encoding if no label smoothing
-            target_onehot = F.one_hot(target, num_classes=logits.shape[-1]).to(torch.float32)
-
-        predicted_prob = F.softmax(logits, dim=-1)
-        predicted_prob_pos = predicted_prob[:, 1]
-        target_pos = target_onehot[:, 1]
+            logits = logits[mask]
+
+        # Only the positive class column of the (smoothed) one-hot target is used
+        smoothing_value = self.label_smoothing / (logits.shape[-1] - 1) if self.label_smoothing > 0.0 else 0.0
+        target_pos = torch.full(target.shape, smoothing_value, dtype=torch.float32, device=target.device)
+        target_pos.masked_fill_(target == 1, 1.0 - self.label_smoothing)
+
+        # Binary case: softmax([x_0, x_1])[1] = sigmoid(x_1 - x_0)
+        predicted_prob_pos = torch.sigmoid(logits[:, 1] - logits[:, 0])
 
         inter = (predicted_prob_pos * target_pos).sum()
         union = predicted_prob_pos.sum() + target_pos.sum()
 
         loss = 1 - 2 * inter / union
 
-        # Not used but kept for future reference
-        if self.reduction is None:
-            return loss
-        elif self.reduction == "mean":
-            return loss.mean()
-        elif self.reduction == "sum":
-            return loss.sum()
-        else:
-            raise ValueError(
-                "DiceLoss: reduction parameter not in list of acceptable values [\"mean\", \"sum\", None]")
+        return self._reduce(loss)
 
 
 class FocalLoss(nn.Module):
@@ -362,10 +329,11 @@ class FocalLoss(nn.Module):
     def __init__(self, gamma=0, alpha=None, reduction=None):
         super(FocalLoss, self).__init__()
         self.gamma = gamma
-        self.alpha = alpha
-        if isinstance(alpha, (float, int)): self.alpha = torch.Tensor([alpha, 1 - alpha])
-        if isinstance(alpha, list): self.alpha = torch.Tensor(alpha)
+        if isinstance(alpha, (float, int)): alpha = [alpha, 1 - alpha]
+        if alpha is not None: alpha = torch.as_tensor(alpha, dtype=torch.float32)
+        self.register_buffer('alpha', alpha)
         self.reduction = reduction
+        self._reduce = _get_reduce(reduction, "FocalLoss")
 
     def forward(self, input, target):
         if input.dim() > 2:
@@ -374,27 +342,22 @@ class FocalLoss(nn.Module):
             input = input.contiguous().view(-1, input.size(2))  # N,H*W,C => N*H*W,C
         target = target.view(-1, 1)
 
-        logpt = F.log_softmax(input, dim=1)
-        logpt = logpt.gather(1, target)
-        logpt = logpt.view(-1)
+        logpt = -F.cross_entropy(input, target.view(-1), reduction='none')
         pt = Variable(logpt.data.exp())
 
         if self.alpha is not None:
-            if self.alpha.type() != input.data.type():
-                self.alpha = self.alpha.type_as(input.data)
             at = self.alpha.gather(0, target.data.view(-1))
             logpt = logpt * Variable(at)
 
-        loss = -1 * (1 - pt) ** self.gamma * logpt
-        if self.reduction is None:
-            return loss
-        elif self.reduction == "mean":
-            return loss.mean()
-        elif self.reduction == "sum":
-            return loss.sum()
-        else:
-            raise ValueError(
-                "FocalLoss: reduction parameter not in list of acceptable values [\"mean\", \"sum\", None]")
+        loss = _focal_core(logpt, pt, float(self.gamma))
+        return self._reduce(loss)
+
+
+@torch.jit.script
+def _tversky_core(TP: torch.Tensor, FP: torch.Tensor, FN: torch.Tensor, smooth: float, alpha: float, beta: float,
+                  gamma: float) -> torch.Tensor:
+    Tversky = (TP + smooth) / (TP + alpha * FP + beta * FN + smooth)
+    return (1 - Tversky).pow(gamma)
 
 
 # Tversky Loss adapted from https://www.kaggle.com/code/bigironsphere/loss-function-library-keras-pytorch
@@ -407,6 +370,7 @@ class FocalTverskyLoss(nn.Module):
         self.alpha = alpha
         self.gamma = gamma
         self.reduction = reduction
+        self._reduce = _get_reduce(reduction, "FocalTverskyLoss")
 
     def forward(self, inputs, targets):
 
@@ -416,39 +380,36 @@ class FocalTverskyLoss(nn.Module):
             inputs = inputs.transpose(1, 2)  # N,C,H*W => N,H*W,C
             inputs = inputs.contiguous().view(-1, inputs.size(2))  # N,H*W,C => N*H*W,C
 
-        inputs = F.softmax(inputs, dim=1)
+        if inputs.shape[-1] != 2:
+            raise ValueError("FocalTverskyLoss: expects 2 classes, got %d" % inputs.shape[-1])
+
+        # Binary case: softmax([x_0, x_1])[1] = sigmoid(x_1 - x_0)
+        p1 = torch.sigmoid(inputs[:, 1] - inputs[:, 0])
+        p0 = 1 - p1
 
         #flatten label and prediction tensors
         targets = targets.view(-1)
 
         #True Positives, False Positives & False Negatives in Binary case
-        TP = (inputs[:, 1] * targets).sum()
-        FP = ((1-targets) * inputs[:, 1]).sum()
-        FN = (targets * inputs[:, 0]).sum()
+        TP = (p1 * targets).sum()
+        FP = ((1-targets) * p1).sum()
+        FN = (targets * p0).sum()
 
-        Tversky = (TP + self.smooth) / (TP + self.alpha*FP + self.beta*FN + self.smooth)
-        loss = (1 - Tversky)**self.gamma
+        loss = _tversky_core(TP, FP, FN, float(self.smooth), float(self.alpha), float(self.beta), float(self.gamma))
 
-        # Not used but kept for future reference
-        if self.reduction is None:
-            return loss
-        elif self.reduction == "mean":
-            return loss.mean()
-        elif self.reduction == "sum":
-            return loss.sum()
-        else:
-            raise ValueError(
-                "TverskyLoss: reduction parameter not in list of acceptable values [\"mean\", \"sum\", None]")
+        return self._reduce(loss)
 
 
 class CombinedLoss(nn.Module):
     def __init__(self, loss_fns: List[nn.Module], weights: List[float]):
         super(CombinedLoss, self).__init__()
         self.loss_fns = loss_fns
-        self.weights = weights
+        self.register_buffer('weights', torch.as_tensor(weights, dtype=torch.float32))
 
     def forward(self, inputs, targets):
-        loss = 0
-        for i, loss_fn in enumerate(self.loss_fns):
-            loss += self.weights[i] * loss_fn(inputs, targets)
-        return loss
+        losses = torch.stack([loss_fn(inputs, targets) for loss_fn in self.loss_fns])
+        if losses.dim() != 1:
+            raise ValueError("CombinedLoss: sub-losses must reduce to scalars, got stacked losses of shape %s"
+                             % str(tuple(losses.shape)))
+        # weights buffer is already on device (get_loss), only match the dtype of the losses e.g. under autocast
+        return torch.dot(self.weights.to(losses.dtype), losses)